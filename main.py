@@ -1,15 +1,19 @@
+import asyncio
+import functools
 import math
 import os
-import random
 import signal
-import struct
 import subprocess
 import sys
 import tempfile
 import threading
+import time
 import wave
+from collections.abc import Callable
 from pathlib import Path
+from typing import ClassVar
 
+import numpy as np
 from textual.app import App, ComposeResult
 from textual.containers import Center, Vertical
 from textual.reactive import reactive
@@ -18,11 +22,25 @@ from textual.timer import Timer
 from textual.widgets import Button, Footer, Header, Label, OptionList
 from textual.widgets.option_list import Option
 
+try:
+    import simpleaudio  # type: ignore[import-untyped, import-not-found]
+except ImportError:
+    simpleaudio = None
+
 
 WORK_SECONDS = 25 * 60
 SHORT_BREAK_SECONDS = 5 * 60
 LONG_BREAK_SECONDS = 15 * 60
 SESSIONS_BEFORE_LONG_BREAK = 4
+SAMPLE_RATE = 44100
+
+_PHASE_NAMES = {"work": "WORK", "short_break": "SHORT BREAK", "long_break": "LONG BREAK"}
+
+# "MM:SS" for every value time_left can take during a phase.
+_TIME_STRS = tuple(
+    f"{s // 60:02d}:{s % 60:02d}"
+    for s in range(max(WORK_SECONDS, SHORT_BREAK_SECONDS, LONG_BREAK_SECONDS) + 1)
+)
 
 TICK_SOUNDS = [
     "Mechanical Clock",
@@ -45,177 +63,132 @@ AMBIENT_SOUNDS: dict[str, str] = {
 
 _APP_DIR = Path(__file__).resolve().parent
 
+# Bump whenever the synthesis formulas change so stale cached WAVs are ignored.
+_SOUND_CACHE_VERSION = "v1"
+
+
+def _sound_cache_dir() -> Path:
+    """Return the directory generated WAV files are cached in."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "pomodoro" / _SOUND_CACHE_VERSION
+
+
+def _write_wav(path: Path, pcm: np.ndarray, sample_rate: int) -> None:
+    """Write mono little-endian int16 PCM to path, replacing it atomically."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with wave.open(str(tmp), "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm.data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _time_vector(n_samples: int) -> np.ndarray:
+    """Return the sample times for a sound of n_samples."""
+    return np.arange(n_samples, dtype=np.float64) / SAMPLE_RATE
+
+
+def _env(t: np.ndarray, k: float) -> np.ndarray:
+    """Exponential decay envelope with rate k."""
+    return np.exp(-t * k)
+
+
+def _tone(t: np.ndarray, freq: float | np.ndarray) -> np.ndarray:
+    """Sine tone at freq Hz (a scalar or a per-sample sweep)."""
+    return np.sin(2 * np.pi * freq * t)
+
+
+def _quantize(samples: np.ndarray, scale: int) -> np.ndarray:
+    """Clip samples to [-1, 1], scale and truncate to int16.
+
+    Clip and scale reuse the samples buffer, so the only new array is the
+    int16 result; this is still three passes over the data, not one kernel.
+    """
+    np.clip(samples, -1.0, 1.0, out=samples)
+    samples *= scale
+    return samples.astype("<i2")
+
 
 def _generate_sound(name: str, path: Path) -> None:
     """Generate a tick sound WAV file based on the preset name."""
-    sample_rate = 44100
-    random.seed(42)
+    rng = np.random.default_rng(42)
 
     if name == "Mechanical Clock":
-        duration = 0.035
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 300)
-            low = math.sin(2 * math.pi * 120 * t)
-            mid = math.sin(2 * math.pi * 800 * t)
-            noise = random.uniform(-1, 1)
-            attack = math.exp(-t * 600)
-            sample = envelope * (0.35 * low + 0.30 * mid + 0.35 * noise * attack)
-            samples.append(int(12000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.035))
+        noise = rng.uniform(-1, 1, t.size)
+        samples = _env(t, 300) * (
+            0.35 * _tone(t, 120)
+            + 0.30 * _tone(t, 800)
+            + 0.35 * noise * _env(t, 600)
+        )
+        scale = 12000
 
     elif name == "Soft Click":
-        duration = 0.015
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 800)
-            tone = math.sin(2 * math.pi * 3000 * t)
-            sample = envelope * tone
-            samples.append(int(8000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.015))
+        samples = _env(t, 800) * _tone(t, 3000)
+        scale = 8000
 
     elif name == "Woodblock":
-        duration = 0.04
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 200)
-            tone = math.sin(2 * math.pi * 600 * t) + 0.5 * math.sin(2 * math.pi * 1200 * t)
-            sample = envelope * tone
-            samples.append(int(10000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.04))
+        samples = _env(t, 200) * (_tone(t, 600) + 0.5 * _tone(t, 1200))
+        scale = 10000
 
     elif name == "Metronome":
-        duration = 0.025
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 400)
-            tone = math.sin(2 * math.pi * 1000 * t)
-            sample = envelope * tone
-            samples.append(int(14000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.025))
+        samples = _env(t, 400) * _tone(t, 1000)
+        scale = 14000
 
     elif name == "Drip":
         duration = 0.06
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 150)
-            freq = 1200 - 800 * (t / duration)
-            tone = math.sin(2 * math.pi * freq * t)
-            sample = envelope * tone
-            samples.append(int(10000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * duration))
+        samples = _env(t, 150) * _tone(t, 1200 - 800 * (t / duration))
+        scale = 10000
 
     elif name == "Typewriter":
-        duration = 0.012
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 1000)
-            noise = random.uniform(-1, 1)
-            tone = math.sin(2 * math.pi * 4000 * t)
-            sample = envelope * (0.6 * noise + 0.4 * tone)
-            samples.append(int(14000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.012))
+        noise = rng.uniform(-1, 1, t.size)
+        samples = _env(t, 1000) * (0.6 * noise + 0.4 * _tone(t, 4000))
+        scale = 14000
 
     elif name == "Pulse":
-        duration = 0.05
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 180)
-            tone = math.sin(2 * math.pi * 60 * t) + 0.5 * math.sin(2 * math.pi * 120 * t)
-            sample = envelope * tone
-            samples.append(int(16000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.05))
+        samples = _env(t, 180) * (_tone(t, 60) + 0.5 * _tone(t, 120))
+        scale = 16000
 
     elif name == "Chirp":
         duration = 0.04
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 250)
-            freq = 800 + 2000 * (t / duration)
-            tone = math.sin(2 * math.pi * freq * t)
-            sample = envelope * tone
-            samples.append(int(10000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * duration))
+        samples = _env(t, 250) * _tone(t, 800 + 2000 * (t / duration))
+        scale = 10000
 
     elif name == "Snap":
-        duration = 0.008
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 1500)
-            noise = random.uniform(-1, 1)
-            sample = envelope * noise
-            samples.append(int(16000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.008))
+        noise = rng.uniform(-1, 1, t.size)
+        samples = _env(t, 1500) * noise
+        scale = 16000
 
     elif name == "Sonar":
-        duration = 0.15
-        n_samples = int(sample_rate * duration)
-        samples = []
-        for i in range(n_samples):
-            t = i / sample_rate
-            envelope = math.exp(-t * 30)
-            tone = math.sin(2 * math.pi * 1500 * t)
-            sample = envelope * tone
-            samples.append(int(8000 * max(-1.0, min(1.0, sample))))
+        t = _time_vector(int(SAMPLE_RATE * 0.15))
+        samples = _env(t, 30) * _tone(t, 1500)
+        scale = 8000
 
     else:
         return
 
-    raw = b"".join(struct.pack("<h", s) for s in samples)
-    with wave.open(str(path), "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(raw)
+    _write_wav(path, _quantize(samples, scale), SAMPLE_RATE)
 
 
 def _generate_bell_sound(path: Path) -> None:
     """Generate a bell/chime WAV file to play when a phase ends."""
-    sample_rate = 44100
-    duration = 1.0
-    n_samples = int(sample_rate * duration)
-    samples = []
-    for i in range(n_samples):
-        t = i / sample_rate
-        envelope = math.exp(-t * 3)
-        tone = (
-            0.5 * math.sin(2 * math.pi * 880 * t)
-            + 0.3 * math.sin(2 * math.pi * 1760 * t)
-            + 0.2 * math.sin(2 * math.pi * 2640 * t)
-        )
-        sample = envelope * tone
-        samples.append(int(16000 * max(-1.0, min(1.0, sample))))
-    raw = b"".join(struct.pack("<h", s) for s in samples)
-    with wave.open(str(path), "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sample_rate)
-        wf.writeframes(raw)
-
-
-def _play_tick(path: Path) -> None:
-    """Play the tick WAV file asynchronously using a platform command."""
-    if sys.platform == "darwin":
-        subprocess.Popen(
-            ["afplay", str(path)],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    else:
-        subprocess.Popen(
-            ["aplay", "-q", str(path)],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+    t = _time_vector(int(SAMPLE_RATE * 1.0))
+    tone = 0.5 * _tone(t, 880) + 0.3 * _tone(t, 1760) + 0.2 * _tone(t, 2640)
+    samples = _env(t, 3) * tone
+    _write_wav(path, _quantize(samples, 16000), SAMPLE_RATE)
 
 
 class SoundPickerScreen(ModalScreen[str]):
@@ -257,15 +230,14 @@ class PomodoroApp(App):
 
     def __init__(self) -> None:
         super().__init__()
-        self._tick_dir = Path(tempfile.mkdtemp())
+        self._tick_dir = _sound_cache_dir()
+        self._tmp_dir: tempfile.TemporaryDirectory[str] | None = None
         self._sound_paths: dict[str, Path] = {}
-        for name in TICK_SOUNDS:
-            p = self._tick_dir / f"{name}.wav"
-            _generate_sound(name, p)
-            self._sound_paths[name] = p
-        self._tick_path = self._sound_paths["Metronome"]
+        self._use_simpleaudio = simpleaudio is not None
+        self._wave_objs: dict[Path, simpleaudio.WaveObject] = {}
+        self._tick_path = self._tick_dir / "Metronome.wav"
         self._bell_path = self._tick_dir / "bell.wav"
-        _generate_bell_sound(self._bell_path)
+        self._players: list[subprocess.Popen] = []
         self._is_ambient = False
         self._ambient_proc: subprocess.Popen | None = None
         self._ambient_stop = threading.Event()
@@ -284,7 +256,27 @@ class PomodoroApp(App):
             yield Label(self._session_text(), id="session-label")
         yield Footer()
 
+    def on_mount(self) -> None:
+        # Synthesizing sounds can take a moment on first launch; keep it off
+        # the event loop so the timer paints straight away.
+        self._sounds_ready = asyncio.get_running_loop().run_in_executor(
+            None, self._build_sounds
+        )
+        self._sounds_ready.add_done_callback(self._on_sounds_built)
+        self.install_screen(SoundPickerScreen(), name="sound_picker")
+        self._timer_label = self.query_one("#timer", Label)
+        self._phase_label = self.query_one("#phase-label", Label)
+        self._session_label = self.query_one("#session-label", Label)
+        self._toggle_btn = self.query_one("#toggle-btn", Button)
+
+    def on_unmount(self) -> None:
+        if self._tmp_dir is not None:
+            self._tmp_dir.cleanup()
+            self._tmp_dir = None
+
     def _format_time(self, seconds: int) -> str:
+        if 0 <= seconds < len(_TIME_STRS):
+            return _TIME_STRS[seconds]
         m, s = divmod(seconds, 60)
         return f"{m:02d}:{s:02d}"
 
@@ -294,21 +286,18 @@ class PomodoroApp(App):
     # --- Reactive watchers ---------------------------------------------------
 
     def watch_time_left(self, value: int) -> None:
-        self.query_one("#timer", Label).update(self._format_time(value))
+        self._timer_label.update(self._format_time(value))
         if value <= 0:
             self._advance_phase()
 
     def watch_is_running(self, value: bool) -> None:
-        btn = self.query_one("#toggle-btn", Button)
-        btn.label = "Pause" if value else "Start"
+        self._toggle_btn.label = "Pause" if value else "Start"
 
     def watch_phase(self, value: str) -> None:
-        label = self.query_one("#phase-label", Label)
-        names = {"work": "WORK", "short_break": "SHORT BREAK", "long_break": "LONG BREAK"}
-        label.update(names.get(value, value.upper()))
+        self._phase_label.update(_PHASE_NAMES.get(value, value.upper()))
 
     def watch_session_count(self) -> None:
-        self.query_one("#session-label", Label).update(self._session_text())
+        self._session_label.update(self._session_text())
 
     def watch_tick_sound(self, value: str) -> None:
         was_running = self.is_running
@@ -318,9 +307,12 @@ class PomodoroApp(App):
         if value in AMBIENT_SOUNDS:
             self._is_ambient = True
             self._tick_path = _APP_DIR / AMBIENT_SOUNDS[value]
-        elif value in self._sound_paths:
-            self._is_ambient = False
-            self._tick_path = self._sound_paths[value]
+        elif value in TICK_SOUNDS:
+            try:
+                self._tick_path = self._ensure_sound(value)
+                self._is_ambient = False
+            except OSError as exc:
+                self.notify(f"Could not prepare {value}: {exc}", severity="error")
         if was_running:
             self._start_tick()
 
@@ -328,8 +320,82 @@ class PomodoroApp(App):
         if name:
             self.tick_sound = name
 
-    def action_pick_sound(self) -> None:
-        self.push_screen(SoundPickerScreen(), callback=self._on_sound_picked)
+    async def action_pick_sound(self) -> None:
+        # Wait without re-raising: a failed build was already reported by
+        # _on_sounds_built, and ambient sounds don't need it.
+        await asyncio.wait([self._sounds_ready])
+        self.push_screen("sound_picker", callback=self._on_sound_picked)
+
+    # --- Sound playback -------------------------------------------------------
+
+    def _on_sounds_built(self, future: asyncio.Future[None]) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            self.log.error(f"Preparing sounds failed: {exc!r}")
+            self.notify(f"Could not prepare tick sounds: {exc}", severity="error")
+
+    def _build_sounds(self) -> None:
+        """Prepare the default tick and the bell (runs in a worker thread)."""
+        self._tick_path = self._ensure_sound("Metronome")
+        self._bell_path = self._prepare_wav("bell.wav", _generate_bell_sound)
+
+    def _ensure_sound(self, name: str) -> Path:
+        """Return the WAV for a tick preset, synthesizing it on first use."""
+        p = self._sound_paths.get(name)
+        if p is None:
+            p = self._prepare_wav(f"{name}.wav", functools.partial(_generate_sound, name))
+            self._sound_paths[name] = p
+        return p
+
+    def _prepare_wav(self, filename: str, generate: Callable[[Path], None]) -> Path:
+        """Return filename in the sound dir, generating it if it is missing."""
+        p = self._tick_dir / filename
+        if not p.exists():
+            try:
+                self._tick_dir.mkdir(parents=True, exist_ok=True)
+                generate(p)
+            except OSError:
+                if self._tmp_dir is not None:
+                    raise
+                # The cache dir can't be written (read-only home, sandbox,
+                # ...): keep sounds for this session only, removed on unmount.
+                self._tmp_dir = tempfile.TemporaryDirectory(prefix="pomodoro-")
+                self._tick_dir = Path(self._tmp_dir.name)
+                p = self._tick_dir / filename
+                generate(p)
+        self._load_for_playback(p)
+        return p
+
+    def _load_for_playback(self, path: Path) -> None:
+        if self._use_simpleaudio:
+            self._wave_objs[path] = simpleaudio.WaveObject.from_wave_file(str(path))
+
+    def _play_tick(self, path: Path) -> None:
+        """Play a WAV file without blocking, in-process when possible."""
+        cmd = ["afplay"] if sys.platform == "darwin" else ["aplay", "-q"]
+        wave_obj = self._wave_objs.get(path)
+        if wave_obj is not None:
+            try:
+                wave_obj.play()
+                return
+            except simpleaudio._simpleaudio.SimpleaudioError as exc:
+                # Usually means no usable audio device; don't retry every tick.
+                self.log.warning(f"simpleaudio playback failed ({exc}); using {cmd[0]}")
+                self._use_simpleaudio = False
+                self._wave_objs.clear()
+        if not path.exists():
+            return
+        self._players = [p for p in self._players if p.poll() is None]
+        self._players.append(
+            subprocess.Popen(
+                cmd + [str(path)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        )
 
     # --- Ambient playback -----------------------------------------------------
 
@@ -377,9 +443,11 @@ class PomodoroApp(App):
     # --- Timer mechanics ------------------------------------------------------
 
     _tick_timer: Timer | None = None
+    _end_time: float | None = None
 
     def _start_tick(self) -> None:
         if self._tick_timer is None:
+            self._end_time = time.monotonic() + self.time_left
             self._tick_timer = self.set_interval(1, self._tick)
         if self._is_ambient:
             self._start_ambient()
@@ -388,19 +456,27 @@ class PomodoroApp(App):
         if self._tick_timer is not None:
             self._tick_timer.stop()
             self._tick_timer = None
+        self._end_time = None
         self._stop_ambient()
 
     def _tick(self) -> None:
-        if self.time_left > 0:
-            self.time_left -= 1
+        # Derive the remaining time from the clock rather than counting
+        # callbacks, so late or missed interval callbacks (e.g. slow renders)
+        # don't stretch the phase. time.monotonic() stops during system
+        # suspend, so time spent asleep is not counted.
+        if self._end_time is None:
+            return
+        remaining = max(0, math.ceil(self._end_time - time.monotonic()))
+        if remaining != self.time_left:
+            self.time_left = remaining
             if not self._is_ambient:
-                _play_tick(self._tick_path)
+                self._play_tick(self._tick_path)
 
     def _advance_phase(self) -> None:
         self.is_running = False
         self._stop_tick()
         self.bell()
-        _play_tick(self._bell_path)
+        self._play_tick(self._bell_path)
 
         if self.phase == "work":
             self.session_count += 1
@@ -442,15 +518,16 @@ class PomodoroApp(App):
         self._stop_tick()
         self.exit()
 
+    _BTN_ACTION_NAMES: ClassVar[dict[str, str]] = {
+        "toggle-btn": "action_toggle_timer",
+        "reset-btn": "action_reset_timer",
+        "skip-btn": "action_skip",
+    }
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
-        actions = {
-            "toggle-btn": self.action_toggle_timer,
-            "reset-btn": self.action_reset_timer,
-            "skip-btn": self.action_skip,
-        }
-        action = actions.get(event.button.id or "")
-        if action:
-            action()
+        name = self._BTN_ACTION_NAMES.get(event.button.id or "")
+        if name:
+            getattr(self, name)()
 
 
 if __name__ == "__main__":